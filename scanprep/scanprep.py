@@ -1,117 +1,460 @@
 import argparse
+import atexit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import fitz
-from PIL import Image, ImageFilter, ImageEnhance, ImageStat
+from functools import partial
+import hashlib
+import logging
+from PIL import Image
 import numpy as np
 import os
 import pathlib
 from pyzbar.pyzbar import decode
 import pytesseract
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
 
-# Enable/disable debug output.
-debug = True
+# Tesseract's OpenMP threading performs poorly on small images. This needs to be set before the library is loaded.
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
 
+# tesserocr is optional. If it is available, we keep a single Tesseract instance around instead of spawning a new
+# `tesseract` process (and reloading the language model) for every page.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Debug output is enabled with `--verbose`.
+logger = logging.getLogger(__name__)
+LOG_FORMAT = '%(message)s'
+
+# Where the detection results for previously seen pages are cached.
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                  'scanprep', 'cache.sqlite3')
+# Bump this whenever the page detection changes, so that outdated cache entries are ignored.
+CACHE_VERSION = 5
+
+# Tesseract configuration for better results with scanned documents.
+TESSERACT_CONFIG = r'--oem 1 --psm 11 --dpi 300'
+# Used to clean up the OCR output -> see `clean_text`. `\w` also matches the underscore, which isn't alphanumeric.
+EMPTY_LINES_REGEX = re.compile(r'\n{2,}')
+NON_ALNUM_REGEX = re.compile(r'[^\w\s]|_')
+
+# Lazily initialized by `get_tesseract_api`.
+_tesseract_api = None
+# The document processed by a worker process and its cache connection, opened once by `init_worker`.
+_worker_doc = None
+_worker_cache = None
+
+# Erode the white pixels of a binarized image with a 3x3 square, like `ImageFilter.MinFilter(3)` does.
+# The square is separable, so this is one vertical and one horizontal pass over the boolean mask.
+def erode_3x3(white):
+    vertical = white.copy()
+    vertical[1:] &= white[:-1]
+    vertical[:-1] &= white[1:]
+
+    eroded = vertical.copy()
+    eroded[:, 1:] &= vertical[:, :-1]
+    eroded[:, :-1] &= vertical[:, 1:]
+    return eroded
+
+# Determine the ratio of dark pixels on the page, ignoring the margins.
 # Algorithm inspired by: https://dsp.stackexchange.com/a/48837
-def page_is_empty_by_image(img, pagenumber=None, ratio_threshold=0.005):
-    # Image should be in grayscale and binarized -> see `convert_img_to_grayscale_and_binarize`.
+def dark_ratio_by_image(gray, white_lut, pagenumber=None, strip_height=256):
+    # The image is binarized using the lookup table -> see `binarization_lut`.
     # Staples, folds, punch holes et al. tend to be confined to the left and right margin, so we crop off 10% there.
     # Also, we crop off 5% at the top and bottom to get rid of the page borders.
-    lr_margin = img.width * 0.10
-    tb_margin = img.height * 0.05
-    img = img.crop((lr_margin, tb_margin, img.width - lr_margin, img.height - tb_margin))
+    height, width = gray.shape
+    lr_margin = round(width * 0.10)
+    tb_margin = round(height * 0.05)
+    gray = gray[tb_margin:height - tb_margin, lr_margin:width - lr_margin]
 
-    # Use erosion and dilation to get rid of small specks but make actual text/content more significant.
-    img = img.filter(ImageFilter.MaxFilter(1))
-    img = img.filter(ImageFilter.MinFilter(3))
+    # For high resolution scans, the intermediate arrays wouldn't fit into the CPU caches anymore, so we binarize, erode
+    # and count in strips of rows. Each strip also gets the row above and below, as the erosion needs those.
+    white_pixels = 0
+    for top in range(0, gray.shape[0], strip_height):
+        bottom = min(top + strip_height, gray.shape[0])
+        context_top = max(top - 1, 0)
+        # Use erosion to get rid of small specks but make actual text/content more significant.
+        white = erode_3x3(white_lut[gray[context_top:bottom + 1]])
+        white_pixels += np.count_nonzero(white[top - context_top:bottom - context_top])
 
-    white_pixels = np.count_nonzero(img)
-    total_pixels = img.size[0] * img.size[1]
-    ratio = (total_pixels - white_pixels) / total_pixels
+    ratio = (gray.size - white_pixels) / gray.size
 
-    if debug:
-        print(f"P. {pagenumber} Ratio: {ratio:.5f}")
+    logger.debug("P. %s Ratio: %.5f", pagenumber, ratio)
 
-    return ratio < ratio_threshold
+    return ratio
 
-# Convert image to grayscale and binarize.
-def convert_img_to_grayscale_and_binarize(img):
-    threshold = np.mean(ImageStat.Stat(img).mean) - 50
-    return img.convert('L').point(lambda x: 255 if x > threshold else 0)
+# Brighten (like `ImageEnhance.Brightness` does) and binarize a grayscale image array. Instead of the binarized image,
+# this returns a lookup table that is `True` for the gray values that become white, as in `white_lut[gray]`.
+def binarization_lut(gray, brightness=1.5):
+    # Brightening maps each gray value to a new one, so instead of creating a brightened copy of the image, we only need
+    # a lookup table and the histogram to compute the mean of the brightened image.
+    lut = np.minimum(np.arange(256) * brightness, 255).astype(np.uint8)
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    threshold = (histogram @ lut) / gray.size - 50
+    return lut > threshold
 
-# Brighten image up.
-def brighten_image(img, factor=1.5):
-    enhancer = ImageEnhance.Brightness(img)
-    brightened_img = enhancer.enhance(factor)
-    return brightened_img
+# Check whether the text (from the PDF's text layer or OCR) has any actual content.
+def page_has_text(page_text):
+    return len(page_text.strip()) > 0
 
-# Summarizes the page detection by checking if it is empty or a separator.
-def page_is_empty(img, page_text, pagenumber=None):
-    img = brighten_image(img)
-    img = convert_img_to_grayscale_and_binarize(img)
+# Convert the binarized image to the 8-bit grayscale image we pass to Tesseract.
+def ocr_image(white):
+    return white.view(np.uint8) * 255
 
-    if len(page_text) == 0:
-        page_text = extract_text(img)
+# Summarizes the page detection by checking if it is empty or a separator.
+# With `ocr=False`, `None` is returned for pages that can only be decided by OCR.
+def page_is_empty(gray, white_lut, page_text, pagenumber=None, ocr=True):
+    ratio = dark_ratio_by_image(gray, white_lut, pagenumber)
 
-    if len(page_text) == 0:
-        empty_by_image = page_is_empty_by_image(img, pagenumber, ratio_threshold=0.010)
+    # OCR is by far the slowest part, so we only use it for pages that aren't already decided by the image alone:
+    # Below a ratio of 0.005, a page without text is empty. From a ratio of 0.010, a page is never empty. In between,
+    # it is only empty if OCR doesn't find any text, either.
+    if page_has_text(page_text) or ratio >= 0.010:
+        empty = False
+    elif ratio < 0.005:
+        empty = True
+    elif not ocr:
+        empty = None
     else:
-        empty_by_image = page_is_empty_by_image(img, pagenumber)
+        page_text = extract_text(Image.fromarray(ocr_image(white_lut[gray])))
+        empty = not page_has_text(page_text)
+
+    if empty is not None:
+        logger.debug("P. %s Empty: %s", pagenumber, empty)
+        logger.debug("P. %s Text-Length: %d", pagenumber, len(page_text))
+
+    return empty
+
+# Find the windows of `run` pixels along the first axis of the `dark` mask that are dark throughout.
+def long_dark_runs(dark, run):
+    # With the cumulative sum, the number of dark pixels in each window is a single difference.
+    counts = np.zeros((dark.shape[0] + 1, dark.shape[1]), dtype=np.int32)
+    np.cumsum(dark, axis=0, out=counts[1:])
+    return (counts[run:] - counts[:-run]) == run
+
+# Find the region of the binarized image that could contain a barcode, as `(top, bottom, left, right)`, or `None` if
+# there can't be a barcode at all. Both the bars of linear barcodes and the finder patterns of 2D codes make for several
+# lines with a long run of dark pixels, whereas lines of regular text are too short for that. Linear barcodes can be
+# rotated, so we look for vertical as well as horizontal runs.
+def barcode_region(white, min_run_ratio=0.015, min_lines=3):
+    height, width = white.shape
+    run = max(round(height * min_run_ratio), 1)
+    dark = ~white
+    vertical_windows = long_dark_runs(dark, run)
+    horizontal_windows = long_dark_runs(dark.T, run)
+
+    columns = np.flatnonzero(vertical_windows.any(axis=0))
+    rows = np.flatnonzero(horizontal_windows.any(axis=0))
+    if len(columns) < min_lines and len(rows) < min_lines:
+        return None
 
-    if debug:
-        print(f"P. {pagenumber} Empty by image: {empty_by_image}")
-        print(f"P. {pagenumber} Text-Length: {len(page_text)}")
+    # The region has to cover the runs in both directions, so that the crop doesn't cut off a barcode in either
+    # orientation.
+    rows = np.concatenate((np.flatnonzero(vertical_windows.any(axis=1)), rows))
+    columns = np.concatenate((columns, np.flatnonzero(horizontal_windows.any(axis=1))))
 
-    return empty_by_image and len(page_text.strip()) == 0
+    # Barcodes need a quiet zone around them to be decoded.
+    margin = 2 * run
+    return (max(rows.min() - margin, 0), min(rows.max() + run + margin, height),
+            max(columns.min() - margin, 0), min(columns.max() + run + margin, width))
 
 # Check if the page is a separator by looking for a barcode with the value 'SCANPREP_SEP'.
-def page_is_separator(img, pagenumber=None):
-    detected_barcodes = decode(img)
+def page_is_separator(gray, white, pagenumber=None):
+    # Decoding is expensive, so we skip it for pages that can't contain a barcode, which is most of them, and otherwise
+    # only decode the part of the page where the barcode can be.
+    region = barcode_region(white)
+    if region is not None:
+        top, bottom, left, right = region
+        detected_barcodes = decode(gray[top:bottom, left:right])
+    else:
+        detected_barcodes = []
     for barcode in detected_barcodes:
         if barcode.data == b'SCANPREP_SEP':
-            if debug:
-                print(f"P. {pagenumber} Separator detected.")
+            logger.debug("P. %s Separator detected.", pagenumber)
             return True
-    if debug:
-        print(f"P. {pagenumber} No separator detected.")
+    logger.debug("P. %s No separator detected.", pagenumber)
     return False
 
+# Get the persistent Tesseract API, initializing it on first use.
+def get_tesseract_api():
+    global _tesseract_api
+    if _tesseract_api is None:
+        # Same configuration as `TESSERACT_CONFIG` for the `tesseract` CLI.
+        _tesseract_api = tesserocr.PyTessBaseAPI(
+            lang="deu", psm=tesserocr.PSM.SPARSE_TEXT, oem=tesserocr.OEM.LSTM_ONLY)
+        _tesseract_api.SetVariable('user_defined_dpi', '300')
+        atexit.register(_tesseract_api.End)
+    return _tesseract_api
+
 # Extract text from the image using Tesseract OCR.
 def extract_text(img):
-    # Tesseract configuration for better results with scanned documents.
-    custom_config = r'--oem 1 --psm 11 --dpi 300'
-    text = pytesseract.image_to_string(img, lang="deu", config=custom_config)
+    if tesserocr is not None:
+        api = get_tesseract_api()
+        api.SetImage(img)
+        text = api.GetUTF8Text()
+    else:
+        text = pytesseract.image_to_string(img, lang="deu", config=TESSERACT_CONFIG)
+
+    return clean_text(text)
+
+# Extract text from multiple images (as arrays) with a single `tesseract` run per chunk, so that we don't have to start
+# Tesseract and load the language model for every image. With `jobs > 1`, the chunks are processed in parallel.
+def extract_texts(imgs, jobs=1):
+    if len(imgs) == 0:
+        return []
+    jobs = max(jobs, 1)
+    chunk_size = -(-len(imgs) // jobs)
+    chunks = [imgs[i:i + chunk_size] for i in range(0, len(imgs), chunk_size)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        return [text for texts in executor.map(extract_texts_in_one_run, chunks) for text in texts]
+
+def extract_texts_in_one_run(imgs):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Tesseract accepts a text file listing the images to process instead of a single image.
+        list_path = os.path.join(tmp_dir, 'images.txt')
+        with open(list_path, 'w') as list_file:
+            for i, img in enumerate(imgs):
+                img_path = os.path.join(tmp_dir, f"{i}.png")
+                Image.fromarray(img).save(img_path)
+                list_file.write(img_path + '\n')
+
+        output_base = os.path.join(tmp_dir, 'output')
+        pytesseract.pytesseract.run_tesseract(list_path, output_base, extension='txt', lang="deu",
+                                              config=TESSERACT_CONFIG)
+        with open(output_base + '.txt', encoding='utf-8') as output_file:
+            output = output_file.read()
 
-    # Remove empty lines, all whitespace and non-alphanumeric characters.
-    text = '\n'.join(filter(lambda l: len(l) > 0, text.split('\n')))
-    text = ''.join(filter(lambda c: c.isalnum() or c.isspace(), text))
+    # The text of each image is terminated by a form feed.
+    texts = output.split('\f')[:len(imgs)]
+    return [clean_text(text) for text in texts]
+
+# Remove empty lines, all whitespace and non-alphanumeric characters from the OCR output.
+def clean_text(text):
+    text = EMPTY_LINES_REGEX.sub('\n', text).strip('\n')
+    text = NON_ALNUM_REGEX.sub('', text)
 
     return text
 
-def get_new_docs_pages(doc, separate=True, remove_blank=True):
-    docs = [[]]
+# Open (and create, if necessary) the cache for page detection results. The cache is only an optimization, so if it
+# can't be used, we warn and return `None` to continue without it.
+def open_cache(path):
+    try:
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # The worker processes all write to the same cache, so we need to wait for the others' locks.
+        cache = sqlite3.connect(path, timeout=60, isolation_level=None)
+        cache.execute('PRAGMA journal_mode=WAL')
+        cache.execute('CREATE TABLE IF NOT EXISTS pages (key BLOB PRIMARY KEY, is_separator INTEGER, is_empty INTEGER)')
+    except (OSError, sqlite3.Error) as error:
+        logger.warning("Cannot open the cache at %s, continuing without it: %s", path, error)
+        return None
+    return cache
+
+# Identify a page by its rendered image and its text layer, which are all the detection looks at.
+def page_cache_key(gray, page_text):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{CACHE_VERSION}:{gray.shape[1]}x{gray.shape[0]}:".encode())
+    h.update(page_text.encode())
+    h.update(gray)
+    return h.digest()
+
+# Get the cached `(is_separator, is_empty)` for a page. Either value is `None` if it hasn't been determined yet.
+def load_cached_page(cache, key):
+    try:
+        row = cache.execute('SELECT is_separator, is_empty FROM pages WHERE key = ?', (key,)).fetchone()
+    except sqlite3.Error as error:
+        logger.warning("Cannot read from the cache: %s", error)
+        return None, None
+    if row is None:
+        return None, None
+    return tuple(None if v is None else bool(v) for v in row)
+
+# Store the results for a page. Values that are `None` don't overwrite previously stored ones.
+def store_cached_page(cache, key, is_separator, is_empty):
+    try:
+        cache.execute('INSERT INTO pages (key, is_separator, is_empty) VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                      'is_separator = COALESCE(excluded.is_separator, is_separator), '
+                      'is_empty = COALESCE(excluded.is_empty, is_empty)',
+                      (key, *(None if v is None else int(v) for v in (is_separator, is_empty))))
+    except sqlite3.Error as error:
+        logger.warning("Cannot write to the cache: %s", error)
+
+# Render the page and extract its text layer, returning `(page_no, gray, page_text, pixmap)`.
+def render_page(page, separate=True):
+    page_text = page.get_text("text")
+    # Pages with a text layer are never empty, so unless we need to look for a barcode, we don't need the image at all.
+    if not separate and page_has_text(page_text):
+        return page.number, None, page_text, None
 
-    for page in doc:
-        pixmap = page.get_pixmap()
-        img = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
-        page_text = page.get_text("text")
+    # All of the detection works on grayscale images, so we let MuPDF render to that directly.
+    pixmap = page.get_pixmap(colorspace=fitz.csGRAY, alpha=False)
+    # The array is a view of the pixmap's memory (no copy), so the pixmap has to be kept alive while it is used.
+    gray = np.frombuffer(pixmap.samples_mv, dtype=np.uint8).reshape(pixmap.height, pixmap.width)
+    return page.number, gray, page_text, pixmap
 
-        if separate and page_is_separator(img, page.number +1):
+# Like `render_page`, but copies the image out of the pixmap and returns `(page_no, gray, page_text)`. This is
+# everything the detection needs from MuPDF, so the result can be safely handed to another thread.
+def render_page_detached(page, separate=True):
+    page_no, gray, page_text, _ = render_page(page, separate)
+    return page_no, None if gray is None else gray.copy(), page_text
+
+# Check whether the rendered page is a separator and whether it is empty. Returns `(is_separator, is_empty, None)`.
+# With `defer_ocr`, pages that can only be decided by OCR are returned as `(is_separator, None, (cache_key, img))`
+# instead -> see `run_deferred_ocr`.
+def classify_page(page_no, gray, page_text, separate=True, remove_blank=True, cache=None, defer_ocr=False):
+    if gray is None:
+        # Only happens for pages with text if we don't separate -> see `render_page`.
+        return False, False, None
+
+    key = None
+    cached = (None, None)
+    if cache is not None:
+        key = page_cache_key(gray, page_text)
+        cached = load_cached_page(cache, key)
+    is_separator, is_empty = cached
+
+    # Both checks binarize the image the same way.
+    white_lut = None
+    if separate and is_separator is None:
+        white_lut = binarization_lut(gray)
+        is_separator = page_is_separator(gray, white_lut[gray], page_no + 1)
+    if remove_blank and not (separate and is_separator) and is_empty is None:
+        if page_has_text(page_text):
+            # Pages with a text layer are never empty, there is no need to look at the image.
+            is_empty = False
+        else:
+            if white_lut is None:
+                white_lut = binarization_lut(gray)
+            is_empty = page_is_empty(gray, white_lut, page_text, page_no + 1, ocr=not defer_ocr)
+
+    if cache is not None and (is_separator, is_empty) != cached:
+        store_cached_page(cache, key, is_separator, is_empty)
+
+    is_separator = bool(separate and is_separator)
+    if remove_blank and not is_separator and is_empty is None:
+        return is_separator, None, (key, ocr_image(white_lut[gray]))
+    return is_separator, bool(remove_blank and not is_separator and is_empty), None
+
+# Open the document (and the cache, if enabled) in a worker process. `pdf` is either a path or the raw PDF data.
+def init_worker(pdf, cache_path=None, log_level=logging.INFO):
+    global _worker_doc, _worker_cache
+    # Only has an effect if the worker process didn't inherit the logging configuration.
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    _worker_doc = fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream=pdf, filetype='pdf')
+    _worker_cache = open_cache(cache_path) if cache_path else None
+
+def classify_worker_page(page_no, separate=True, remove_blank=True, defer_ocr=False):
+    # `pixmap` keeps the memory of `gray` alive until we are done with the page.
+    page_no, gray, page_text, pixmap = render_page(_worker_doc[page_no], separate)
+    return classify_page(page_no, gray, page_text, separate, remove_blank, _worker_cache, defer_ocr)
+
+# Consume the iterable in a background thread, keeping up to `maxsize` items ready for the caller.
+def prefetch(iterable, maxsize=4):
+    items = queue.Queue(maxsize)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except Exception as e:
+            items.put((done, e))
+        else:
+            items.put((done, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is done:
+            return
+        yield item
+
+def get_new_docs_pages(doc, separate=True, remove_blank=True, jobs=None, cache_path=None):
+    jobs = min(jobs or os.cpu_count() or 1, doc.page_count)
+    # Without tesserocr, every OCR call would start a new `tesseract` process. Instead, we collect the pages that need
+    # OCR and process them all at once at the end.
+    defer_ocr = tesserocr is None
+
+    if jobs <= 1:
+        cache = open_cache(cache_path) if cache_path else None
+        try:
+            # MuPDF renders the next pages in the background while we are still analyzing the current one.
+            rendered_pages = prefetch(render_page_detached(page, separate) for page in doc)
+            results = [classify_page(*rendered, separate, remove_blank, cache, defer_ocr)
+                       for rendered in rendered_pages]
+        finally:
+            if cache is not None:
+                cache.close()
+    else:
+        # The pages are independent of each other, so we classify them in parallel and only split the document
+        # afterwards.
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(doc.name or doc.tobytes(), cache_path,
+                                           logger.getEffectiveLevel())) as executor:
+            results = list(executor.map(partial(classify_worker_page, separate=separate, remove_blank=remove_blank,
+                                                defer_ocr=defer_ocr), range(doc.page_count)))
+
+    return split_docs_pages(run_deferred_ocr(results, jobs, cache_path))
+
+# Run the OCR that `classify_page` deferred and complete the results to `(is_separator, is_empty)`.
+def run_deferred_ocr(results, jobs=1, cache_path=None):
+    deferred = [(page_no, ocr) for page_no, (_, _, ocr) in enumerate(results) if ocr is not None]
+    texts = extract_texts([img for _, (_, img) in deferred], jobs)
+
+    ocr_is_empty = {}
+    cache = open_cache(cache_path) if cache_path and deferred else None
+    for (page_no, (key, _)), page_text in zip(deferred, texts):
+        ocr_is_empty[page_no] = not page_has_text(page_text)
+        logger.debug("P. %s Empty: %s", page_no + 1, ocr_is_empty[page_no])
+        logger.debug("P. %s Text-Length: %d", page_no + 1, len(page_text))
+        if cache is not None:
+            store_cached_page(cache, key, None, ocr_is_empty[page_no])
+    if cache is not None:
+        cache.close()
+
+    return [(is_separator, ocr_is_empty.get(page_no, is_empty))
+            for page_no, (is_separator, is_empty, _) in enumerate(results)]
+
+# Determine the pages of the new documents from the `(is_separator, is_empty)` results, in page order.
+def split_docs_pages(results):
+    docs = [[]]
+
+    for page_no, (is_separator, is_empty) in enumerate(results):
+        if is_separator:
             docs.append([])
             continue
-        if remove_blank and page_is_empty(img, page_text, page.number +1):
+        if is_empty:
             continue
 
-        docs[-1].append(page.number)
+        docs[-1].append(page_no)
 
     return list(filter(lambda d: len(d) > 0, docs))
 
-def emit_new_documents(doc, filename, out_dir, separate=True, remove_blank=True):
+# Coalesce the sorted page numbers into `(first, last)` ranges of consecutive pages, so they can be copied together.
+def page_ranges(pages):
+    ranges = []
+    for page_no in pages:
+        if ranges and ranges[-1][1] == page_no - 1:
+            ranges[-1][1] = page_no
+        else:
+            ranges.append([page_no, page_no])
+    return ranges
+
+def emit_new_documents(doc, filename, out_dir, separate=True, remove_blank=True, jobs=None, cache_path=None):
     pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
 
-    new_docs = get_new_docs_pages(doc, separate, remove_blank)
+    new_docs = get_new_docs_pages(doc, separate, remove_blank, jobs, cache_path)
     for i, pages in enumerate(new_docs):
         new_doc = fitz.open()  # Will create a new, blank document.
-        for j, page_no in enumerate(pages):
-            new_doc.insert_pdf(doc, from_page=page_no, to_page=page_no, final=(j == len(pages) - 1))
+        ranges = page_ranges(pages)
+        for j, (from_page, to_page) in enumerate(ranges):
+            new_doc.insert_pdf(doc, from_page=from_page, to_page=to_page, final=(j == len(ranges) - 1))
         new_doc.save(os.path.join(out_dir, f"{i}-{filename}"))
 
 # Taken from: https://stackoverflow.com/a/9236426
@@ -126,6 +469,13 @@ class ActionNoYes(argparse.Action):
         else:
             setattr(namespace, self.dest, True)
 
+# Argument type for options that take a number of at least one.
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('input_pdf', help='The PDF document to process.')
@@ -135,10 +485,18 @@ def main():
                                    help='Do (or do not) split document into separate files by the included separator pages. (default yes)'))
     parser._add_action(ActionNoYes('blank-removal', 'remove_blank',
                                    help='Do (or do not) remove empty pages from the output. (default yes)'))
+    parser._add_action(ActionNoYes('cache', 'cache',
+                                   help='Do (or do not) cache the detection results, so that previously seen pages don\'t have to be analyzed again. (default yes)'))
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print debug output for each page.')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=None,
+                        help='The number of pages to process in parallel. (defaults to the number of CPUs)')
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format=LOG_FORMAT)
+
     emit_new_documents(fitz.open(os.path.abspath(args.input_pdf)), os.path.basename(
-        args.input_pdf), os.path.abspath(args.output_dir), args.separate, args.remove_blank)
+        args.input_pdf), os.path.abspath(args.output_dir), args.separate, args.remove_blank, args.jobs,
+        DEFAULT_CACHE_PATH if args.cache else None)
 
 if __name__ == '__main__':
     main()
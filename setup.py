@@ -28,5 +28,8 @@ setuptools.setup(
         'pymupdf>=1.23.5',
         'pyzbar>=0.1.9',
         'pytesseract>=0.3.10'
-    ]
+    ],
+    extras_require={
+        'tesserocr': ['tesserocr>=2.6.0']
+    }
 )
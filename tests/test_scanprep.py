@@ -0,0 +1,126 @@
+import argparse
+import numpy as np
+import pytesseract
+import pytest
+
+from scanprep import scanprep
+
+
+# Stand-in for `tesseract` in batch mode: Writes one "page" per listed image, each terminated by a form feed. Images
+# with any dark pixels get some text.
+def fake_run_tesseract(calls):
+    def run_tesseract(input_filename, output_filename_base, extension, lang, config='', nice=0, timeout=0):
+        from PIL import Image
+
+        with open(input_filename) as list_file:
+            img_paths = list_file.read().split()
+        calls.append(len(img_paths))
+
+        output = ''
+        for img_path in img_paths:
+            if (np.asarray(Image.open(img_path)) == 0).any():
+                output += 'Hallo, Welt!\n\n'
+            output += '\f'
+        with open(f"{output_filename_base}.{extension}", 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+
+    return run_tesseract
+
+
+@pytest.fixture
+def tesseract_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pytesseract.pytesseract, 'run_tesseract', fake_run_tesseract(calls))
+    return calls
+
+
+def blank_img():
+    return np.full((20, 30), 255, dtype=np.uint8)
+
+
+def text_img():
+    img = blank_img()
+    img[5:10, 5:20] = 0
+    return img
+
+
+@pytest.mark.parametrize('jobs', [1, 2, 8, 0, -1])
+def test_extract_texts_batches_images(tesseract_calls, jobs):
+    texts = scanprep.extract_texts([text_img(), blank_img(), text_img()], jobs)
+
+    assert texts == ['Hallo Welt', '', 'Hallo Welt']
+    assert sum(tesseract_calls) == 3
+    assert len(tesseract_calls) <= max(jobs, 1)
+
+
+def test_extract_texts_without_images(tesseract_calls):
+    assert scanprep.extract_texts([], 4) == []
+    assert tesseract_calls == []
+
+
+def test_run_deferred_ocr(tesseract_calls):
+    results = [
+        (False, False, None),
+        (False, None, (None, text_img())),
+        (True, False, None),
+        (False, None, (None, blank_img())),
+    ]
+
+    assert scanprep.run_deferred_ocr(results) == [(False, False), (False, False), (True, False), (False, True)]
+    assert tesseract_calls == [2]
+
+
+@pytest.mark.parametrize('value', ['0', '-1', 'x'])
+def test_positive_int_rejects_invalid_values(value):
+    with pytest.raises((argparse.ArgumentTypeError, ValueError)):
+        scanprep.positive_int(value)
+
+
+def test_positive_int():
+    assert scanprep.positive_int('3') == 3
+
+
+# A page with a linear barcode (random bars of 1 to 4 pixels, 60 pixels high) at the given position.
+def barcode_page(top=300, left=150, rotated=False):
+    rng = np.random.default_rng(0)
+    bars = np.repeat(rng.integers(0, 2, 60).astype(bool), rng.integers(1, 5, 60))
+    barcode = np.tile(~bars, (60, 1))
+    if rotated:
+        barcode = barcode.T
+
+    white = np.ones((842, 596), dtype=bool)
+    white[top:top + barcode.shape[0], left:left + barcode.shape[1]] = barcode
+    return white
+
+
+def test_barcode_region_without_barcode():
+    assert scanprep.barcode_region(np.ones((842, 596), dtype=bool)) is None
+
+
+@pytest.mark.parametrize('rotated', [False, True])
+def test_barcode_region_finds_barcode(rotated):
+    assert scanprep.barcode_region(barcode_page(rotated=rotated)) is not None
+
+
+@pytest.mark.parametrize('rotated', [False, True])
+def test_barcode_region_covers_barcode(rotated):
+    white = barcode_page(rotated=rotated)
+    # Some text with a few long vertical strokes elsewhere on the page must not shrink the region.
+    white[100:120, 400:405] = False
+    top, bottom, left, right = scanprep.barcode_region(white)
+
+    assert np.all(white[:top]) and np.all(white[bottom:])
+    assert np.all(white[:, :left]) and np.all(white[:, right:])
+
+
+def test_open_cache_failure(tmp_path):
+    assert scanprep.open_cache(str(tmp_path / 'file' / 'cache.sqlite3')) is not None
+    assert scanprep.open_cache(str(tmp_path / 'file' / 'cache.sqlite3' / 'cache.sqlite3')) is None
+
+
+def test_broken_cache(tmp_path):
+    cache = scanprep.open_cache(str(tmp_path / 'cache.sqlite3'))
+    cache.close()
+    gray = np.full((842, 596), 255, dtype=np.uint8)
+
+    assert scanprep.classify_page(0, gray, '', cache=cache) == (False, True, None)